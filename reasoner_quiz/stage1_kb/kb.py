@@ -31,6 +31,9 @@ def negate(literal):
 class KB:
     def __init__(self):
         self.facts: Set[Expr] = set()
+        # 긍정/부정 리터럴의 원자를 따로 보관해 모순 검사 시 negate()로 튜플을 만들지 않는다
+        self._pos: Set[str] = set()
+        self._neg: Set[str] = set()
 
     def add_fact(self, fact: Expr) -> bool:
         # === QUIZ: validate and insert a literal fact into the KB ===
@@ -38,16 +41,33 @@ class KB:
         if not is_lit(fact):
             return False
 
+        if is_atom(fact):
+            atom, same, opposite = fact, self._pos, self._neg
+        elif is_atom(fact[1]):
+            atom, same, opposite = fact[1], self._neg, self._pos
+        else:
+            return self._add_nested_not(fact)
+
         # 2. 모순 검사 (Contradiction Check)
         # 예: "P"를 넣으려는데 이미 ("NOT", "P")가 있으면 에러
-        negated_fact = negate(fact)
-        if negated_fact in self.facts:
-            raise ValueError(f"Contradiction detected: {fact} and {negated_fact}")
+        if atom in opposite:
+            raise ValueError(f"Contradiction detected: {fact} and {negate(fact)}")
 
         # 3. 중복 검사 (Duplicate Check)
-        if fact in self.facts:
+        if atom in same:
             return False
 
         # 4. 사실 추가
+        same.add(atom)
+        self.facts.add(fact)
+        return True
+
+    def _add_nested_not(self, fact: Expr) -> bool:
+        # ("NOT", ("NOT", "P")) 같은 중첩 부정은 원자 집합으로 표현되지 않으므로 사실 집합으로 직접 검사
+        negated_fact = negate(fact)
+        if negated_fact in self.facts:
+            raise ValueError(f"Contradiction detected: {fact} and {negated_fact}")
+        if fact in self.facts:
+            return False
         self.facts.add(fact)
         return True
@@ -15,3 +15,11 @@ def test_negate():
     assert negate("Q") == ("NOT", "Q")
     assert negate(("NOT", "Q")) == "Q"
 
+
+def test_negative_literal_conflicts_with_later_atom():
+    kb = KB()
+    assert kb.add_fact(("NOT", "Q"))
+    assert not kb.add_fact(("NOT", "Q"))
+    with pytest.raises(ValueError):
+        kb.add_fact("Q")
+    assert kb.facts == {("NOT", "Q")}
@@ -1,4 +1,5 @@
-﻿from typing import List, Set, Tuple, Union
+﻿from collections import deque
+from typing import Dict, List, Set, Tuple, Union
 
 Expr = Union[str, Tuple[str, str]]
 Rule = Tuple[str, Expr, Expr]
@@ -36,6 +37,16 @@ class KB:
     def __init__(self, facts=None, rules=None):
         self.facts: Set[Expr] = set(facts or [])
         self.rules: List[Rule] = list(rules or [])
+        # 전건(P) -> 후건(Q) 목록: 새 사실이 들어올 때 해당 규칙만 바로 찾기 위한 색인
+        # (self.rules에 직접 붙인 규칙도 반영되도록 forward_chain을 시작할 때마다 다시 만든다)
+        self._trigger: Dict[Expr, List[Expr]] = {}
+
+    def _rebuild_trigger(self):
+        self._trigger = {}
+        for rule in self.rules:
+            if isinstance(rule, tuple) and len(rule) == 3 and rule[0] == 'IMPLIES':
+                _, p, q = rule
+                self._trigger.setdefault(p, []).append(q)
 
     def add_fact(self, fact):
         # === QUIZ: enforce literal integrity before adding ===
@@ -69,25 +80,25 @@ class KB:
 
     def forward_chain(self, max_steps=1000, verbose=False):
         # === QUIZ: drive forward chaining using inference rules ===
-        step = 0
-        while step < max_steps:
-            # 1. 이번 단계에서 도출된 새로운 사실들 수집
-            new_facts = self.rule_modus_ponens()
-
-            # 2. 새로운 사실이 없으면 종료 (Fixpoint 도달)
-            if not new_facts:
-                break
-
-            # 3. 새로운 사실을 KB에 추가 (여기서 모순 발생시 add_fact가 에러 발생시킴)
-            added_count = 0
-            for fact in new_facts:
-                if self.add_fact(fact):
-                    added_count += 1
-
-            # 추가된 사실이 하나도 없으면(모두 중복이었다면) 종료
-            if added_count == 0:
-                break
-
+        self._rebuild_trigger()
+        # 1. 첫 단계는 rule_modus_ponens로 모든 규칙을 한 번 훑고,
+        #    이후에는 새로 추가된 사실(agenda)을 전건으로 하는 규칙만 본다
+        agenda = deque()
+        if max_steps > 0:
+            agenda.extend(q for q in self.rule_modus_ponens() if self.add_fact(q))
+        step = 1
+        while agenda and step < max_steps:
+            # 2. 이번 단계의 agenda에 있는 사실을 전건으로 하는 규칙만 발화
+            next_agenda = deque()
+            while agenda:
+                fact = agenda.popleft()
+                for q in self._trigger.get(fact, ()):
+                    # 3. 새로운 사실을 KB에 추가 (여기서 모순 발생시 add_fact가 에러 발생시킴)
+                    if q not in self.facts and self.add_fact(q):
+                        next_agenda.append(q)
+
+            # 추가된 사실이 하나도 없으면 agenda가 비어 종료 (Fixpoint 도달)
+            agenda = next_agenda
             step += 1
 
         return self.facts
\ No newline at end of file
@@ -6,3 +6,9 @@ def test_mp_chain():
     kb.forward_chain()
     assert "Q" in kb.facts and "R" in kb.facts
 
+
+def test_rules_appended_directly_are_used():
+    kb = KB(facts={"P"}, rules=[("IMPLIES", "P", "Q")])
+    kb.rules.append(("IMPLIES", "Q", "R"))
+    kb.forward_chain()
+    assert "R" in kb.facts
@@ -1,4 +1,6 @@
-﻿from typing import List, Set, Tuple, Union
+﻿from collections import defaultdict
+from itertools import chain
+from typing import Dict, Iterator, List, Set, Tuple, Union
 
 Expr = Union[str, Tuple]
 Rule = Tuple[str, Expr, Expr]
@@ -34,189 +36,353 @@ def is_implies(value):
 
 
 def negate(literal):
-    return literal[1] if is_not(literal) else ("NOT", literal)
+    # is_not/is_atom 호출을 풀어 쓴 같은 검사
+    if (
+        isinstance(literal, tuple)
+        and len(literal) == 2
+        and literal[0] == "NOT"
+        and isinstance(literal[1], str)
+    ):
+        return literal[1]
+    return ("NOT", literal)
+
+
+def tag_of(expr):
+    # 모양 검사는 사실이 들어올 때 한 번만 하고, 그 결과를 버킷 키로 쓴다.
+    # 규칙 메서드는 버킷만 보므로 방문할 때마다 is_and/is_or를 다시 부르지 않는다.
+    # (is_* 함수와 같은 검사를 한 번의 길이/머리 확인으로 풀어 쓴다)
+    if isinstance(expr, str):
+        return "_atom"
+    if isinstance(expr, tuple):
+        size = len(expr)
+        if size == 3 and expr[0] in ("AND", "OR", "IMPLIES"):
+            return expr[0]
+        if size == 2 and expr[0] == "NOT" and isinstance(expr[1], str):
+            return "NOT"
+    return "_other"
 
 
 class KB:
     def __init__(self, facts=None, rules=None):
-        self.facts: Set[Expr] = set(facts or [])
+        # 해시 콘싱 풀: 같은 식은 한 객체를 공유해 집합/딕셔너리 조회의 동등 비교가 동일성 검사로 끝난다.
+        # KB마다 따로 두어 KB가 사라지면 풀도 함께 사라진다
+        self._pool: Dict[Expr, Expr] = {}
+        # 식 -> 부정: 같은 리터럴의 부정을 매번 검사하고 만들지 않도록 기억해 둔다
+        self._negations: Dict[Expr, Expr] = {}
+        self.facts: Set[Expr] = set()
         self.rules: List[Rule] = list(rules or [])
+        # 최상위 태그별 사실 버킷: 각 규칙은 관련 버킷만 훑는다
+        self._by_tag: Dict[str, Set[Expr]] = defaultdict(set)
+        # 선언지 -> 그것을 포함하는 OR 사실 (삼단논법/딜레마의 델타 조회용)
+        self._ors_by_disjunct: Dict[Expr, Set[Expr]] = defaultdict(set)
+        # 함의 규칙만 모은 목록과 중복 확인용 집합, 각 함의가 처음 나온 위치
+        self._implications: List[Rule] = []
+        self._rule_set: Set[Rule] = set()
+        self._impl_pos: Dict[Rule, int] = {}
+        # 전건 -> 함의 규칙 목록 (self.rules 순서 유지)
+        self._impls_by_antecedent: Dict[Expr, List[Rule]] = defaultdict(list)
+        # 후건 -> 함의 규칙 목록 (가언삼단논법의 역방향 조회용)
+        self._impls_by_consequent: Dict[Expr, List[Rule]] = defaultdict(list)
+        # not 후건 -> 함의 규칙 목록 (후건부정/파괴적 딜레마용)
+        self._impls_by_neg_consequent: Dict[Expr, List[Rule]] = defaultdict(list)
+        # id(함의) -> (not 후건, not 전건): 규칙을 넣을 때 한 번만 부정을 계산한다
+        self._rule_negations: Dict[int, Tuple[Expr, Expr]] = {}
+        # 딜레마용: 전건 -> 첫 함의의 후건, not 후건 -> 첫 함의의 not 전건
+        self._first_consequent: Dict[Expr, Expr] = {}
+        self._first_negated_antecedent: Dict[Expr, Expr] = {}
+        # 연언 전건의 각 구성 리터럴 -> 그 연언 전건들
+        self._conj_goals: Dict[Expr, List[Expr]] = defaultdict(list)
+        # 직전 패스 이후 새로 들어온 사실/규칙 (semi-naive 델타)
+        self._delta: Set[Expr] = set()
+        self._fresh_rules: List[Rule] = []
+        # self.rules 중 앞에서부터 몇 개가 색인에 반영되었는지
+        self._synced_rules = 0
+        for fact in facts or []:
+            self.add_fact(fact)
+        self._sync_rules()
+
+    def _intern(self, expr):
+        # 바깥에서 들어온 식은 하위 식까지 풀에 넣는다
+        if isinstance(expr, tuple):
+            expr = tuple(self._intern(part) for part in expr)
+            return self._pool.setdefault(expr, expr)
+        return expr
+
+    def _shared(self, expr):
+        # 이미 풀에 있는 하위 식으로 새로 만든 튜플은 바깥 한 겹만 넣으면 된다
+        return self._pool.setdefault(expr, expr)
+
+    def _negate(self, literal):
+        negated = self._negations.get(literal)
+        if negated is None:
+            negated = negate(literal)
+            if isinstance(negated, tuple):
+                negated = self._shared(negated)
+            self._negations[literal] = negated
+        return negated
 
     def add_fact(self, fact):
+        return self._insert_fact(self._intern(fact))
+
+    def _insert_fact(self, fact):
+        # 추론된 사실은 이미 풀에 있는 식으로만 만들어지므로 다시 intern하지 않는다
         if fact in self.facts:
             return False
         self.facts.add(fact)
+        tag = tag_of(fact)
+        self._by_tag[tag].add(fact)
+        if tag == "OR":
+            self._ors_by_disjunct[fact[1]].add(fact)
+            self._ors_by_disjunct[fact[2]].add(fact)
+        self._delta.add(fact)
+        return True
+
+    def add_rule(self, rule):
+        self._sync_rules()
+        return self._insert_rule(self._intern(rule))
+
+    def _insert_rule(self, rule):
+        if rule in self._rule_set:
+            return False
+        self.rules.append(rule)
+        self._index_rule(rule)
+        self._synced_rules = len(self.rules)
         return True
 
-    def rule_modus_ponens(self) -> List[Expr]:
+    def _sync_rules(self):
+        # add_rule을 거치지 않고 self.rules에 바로 붙인 규칙도 색인에 넣는다
+        rules = self.rules
+        for i in range(self._synced_rules, len(rules)):
+            rule = rules[i] = self._intern(rules[i])
+            if rule not in self._rule_set:
+                self._index_rule(rule)
+        self._synced_rules = len(rules)
+
+    def _index_rule(self, rule):
+        self._rule_set.add(rule)
+        if is_implies(rule):
+            _, p, q = rule
+            self._fresh_rules.append(rule)
+            self._implications.append(rule)
+            self._impl_pos.setdefault(rule, len(self._impl_pos))
+            self._impls_by_antecedent[p].append(rule)
+            self._impls_by_consequent[q].append(rule)
+            not_q, not_p = self._negate(q), self._negate(p)
+            self._rule_negations[id(rule)] = (not_q, not_p)
+            self._impls_by_neg_consequent[not_q].append(rule)
+            # 규칙은 뒤에 붙기만 하므로 처음 등록된 값이 곧 "첫 함의"이다
+            self._first_consequent.setdefault(p, q)
+            self._first_negated_antecedent.setdefault(not_q, not_p)
+            if is_and(p):
+                self._conj_goals[p[1]].append(p)
+                self._conj_goals[p[2]].append(p)
+
+    def _pass_inputs(self, delta, fresh_rules):
+        # 인자가 없으면 전체 사실/규칙을 새것으로 보고 한 번 전부 평가한다.
+        # 호출한 쪽이 결과를 돌면서 사실/규칙을 넣을 수 있으므로 지금 상태를 복사해 둔다
+        if delta is None:
+            delta = frozenset(self.facts)
+        if fresh_rules is None:
+            self._sync_rules()
+            fresh_rules = list(self._implications)
+        return delta, fresh_rules
+
+    def rule_modus_ponens(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: implement modus ponens inference ===
         # P, P->Q => Q
-        derived = []
-        for rule in self.rules:
-            if is_implies(rule):
-                _, p, q = rule
-                if p in self.facts and q not in self.facts:
-                    derived.append(q)
-        return derived
-
-    def rule_modus_tollens(self) -> List[Expr]:
+        delta, fresh_rules = self._pass_inputs(delta, fresh_rules)
+        facts = self.facts
+        impls_of = self._impls_by_antecedent.get
+        for p in delta:
+            for _, _, q in impls_of(p, ()):
+                if q not in facts:
+                    yield q
+        for _, p, q in fresh_rules:
+            # 전건이 델타에 있으면 위에서 이미 나왔다
+            if p in facts and p not in delta and q not in facts:
+                yield q
+
+    def rule_modus_tollens(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: implement modus tollens inference ===
         # not Q, P->Q => not P
-        derived = []
-        for rule in self.rules:
-            if is_implies(rule):
-                _, p, q = rule
-                not_q = negate(q)
-                if not_q in self.facts:
-                    not_p = negate(p)
-                    if not_p not in self.facts:
-                        derived.append(not_p)
-        return derived
-
-    def rule_simplification(self) -> List[Expr]:
+        delta, fresh_rules = self._pass_inputs(delta, fresh_rules)
+        facts = self.facts
+        negations = self._rule_negations
+        impls_of = self._impls_by_neg_consequent.get
+        for not_q in delta:
+            for rule in impls_of(not_q, ()):
+                not_p = negations[id(rule)][1]
+                if not_p not in facts:
+                    yield not_p
+        for rule in fresh_rules:
+            not_q, not_p = negations[id(rule)]
+            if not_q in facts and not_q not in delta and not_p not in facts:
+                yield not_p
+
+    def rule_simplification(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: split conjunction facts into literals ===
         # (P AND Q) => P, Q
-        derived = []
-        for fact in self.facts:
-            if is_and(fact):
-                _, p, q = fact
-                if p not in self.facts: derived.append(p)
-                if q not in self.facts: derived.append(q)
-        return derived
-
-    def rule_conjunction(self) -> List[Expr]:
+        delta, _ = self._pass_inputs(delta, fresh_rules)
+        facts = self.facts
+        for _, p, q in delta & self._by_tag["AND"]:
+            if p not in facts: yield p
+            if q not in facts: yield q
+
+    def rule_conjunction(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: combine literals into conjunctions ===
         # P, Q => (P AND Q)
-        derived = []
-        for rule in self.rules:
-            if is_implies(rule):
-                ant = rule[1]
-                if is_and(ant):
-                    _, p, q = ant
-                    if p in self.facts and q in self.facts:
-                        if ant not in self.facts:
-                            derived.append(ant)
-        return derived
-
-    def rule_disjunctive_addition(self) -> List[Expr]:
+        delta, fresh_rules = self._pass_inputs(delta, fresh_rules)
+        # 새 사실이 구성 리터럴인 연언 전건, 또는 새 규칙의 연언 전건만 확인한다
+        # 후보 목록을 만들지 않고 바로 내보낸다 (중복은 forward_chain의 집합이 흡수)
+        facts = self.facts
+        goals_of = self._conj_goals.get
+        for fact in delta:
+            for ant in goals_of(fact, ()):
+                if ant[1] in facts and ant[2] in facts and ant not in facts:
+                    yield ant
+        for rule in fresh_rules:
+            ant = rule[1]
+            if is_and(ant) and ant[1] in facts and ant[2] in facts and ant not in facts:
+                yield ant
+
+    def rule_disjunctive_addition(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: create disjunctions from literals ===
-        # P => (P OR Q) (목표 없으므로 빈 리스트)
-        return []
+        # P => (P OR Q) (목표 없으므로 아무것도 내보내지 않음)
+        yield from ()
 
-    def rule_disjunctive_syllogism(self) -> List[Expr]:
+    def rule_disjunctive_syllogism(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: drop negated disjuncts to infer the other ===
         # (P OR Q), not P => Q
-        derived = []
-        for fact in self.facts:
-            if is_or(fact):
-                _, p, q = fact
-                if negate(p) in self.facts and q not in self.facts:
-                    derived.append(q)
-                elif negate(q) in self.facts and p not in self.facts:
-                    derived.append(p)
-        return derived
-
-    def rule_hypothetical_syllogism(self) -> List[Rule]:
+        delta, _ = self._pass_inputs(delta, fresh_rules)
+        facts = self.facts
+        # 새 OR 사실, 또는 새 사실의 부정을 선언지로 가진 기존 OR 사실
+        candidates = delta & self._by_tag["OR"]
+        ors_of = self._ors_by_disjunct.get
+        negate = self._negate
+        for fact in delta:
+            ors = ors_of(negate(fact))
+            if ors:
+                candidates |= ors
+            # negate는 리터럴에서만 되돌아오므로 (NOT 복합식)은 안쪽 식으로도 찾는다
+            if tag_of(fact) == "_other" and len(fact) == 2 and fact[0] == "NOT":
+                ors = ors_of(fact[1])
+                if ors:
+                    candidates |= ors
+        for _, p, q in candidates:
+            # 양쪽을 독립적으로 본다: 델타로 돌면 다음 패스에 다시 보지 않기 때문
+            if negate(p) in facts and q not in facts:
+                yield q
+            if negate(q) in facts and p not in facts:
+                yield p
+
+    def rule_hypothetical_syllogism(self, delta=None, fresh_rules=None) -> List[Rule]:
         # === QUIZ: chain implications to form new rules ===
         # P->Q, Q->R => P->R
+        _, fresh_rules = self._pass_inputs(delta, fresh_rules)
+        fresh = set(fresh_rules)
+        # 새 규칙을 r1로 쓰면 전건 인덱스, r2로 쓰면 후건 인덱스로 짝을 찾는다.
+        # 이미 있는 규칙이 나오는 짝은 정렬 전에 버린다.
+        pairs = set()
+        for r1 in fresh:
+            for r2 in self._impls_by_antecedent.get(r1[2], ()):
+                if r1 != r2 and ("IMPLIES", r1[1], r2[2]) not in self._rule_set:
+                    pairs.add((r1, r2))
+        # 모든 함의가 새것이면(첫 패스) 역방향 짝은 위에서 이미 다 나왔다
+        if len(fresh) < len(self._impl_pos):
+            for r2 in fresh:
+                for r1 in self._impls_by_consequent.get(r2[1], ()):
+                    # r1도 새 규칙이면 위의 정방향 조회에서 이미 나온 짝이다
+                    if r1 in fresh or r1 == r2:
+                        continue
+                    if ("IMPLIES", r1[1], r2[2]) not in self._rule_set:
+                        pairs.add((r1, r2))
+
         new_rules = []
-        for r1 in self.rules:
-            if not is_implies(r1): continue
-            for r2 in self.rules:
-                if not is_implies(r2): continue
-                if r1 == r2: continue
-
-                if r1[2] == r2[1]:
-                    new_rule = ("IMPLIES", r1[1], r2[2])
-                    if new_rule not in self.rules and new_rule not in new_rules:
-                        new_rules.append(new_rule)
+        # 목록은 순서 보존용, 중복 확인은 집합으로 한다
+        seen = set()
+        # self.rules 순서대로 내보내야 딜레마가 고르는 "첫 함의"가 바뀌지 않는다
+        pos = self._impl_pos
+        for r1, r2 in sorted(pairs, key=lambda pair: (pos[pair[0]], pos[pair[1]])):
+            new_rule = self._shared(("IMPLIES", r1[1], r2[2]))
+            if new_rule not in seen:
+                seen.add(new_rule)
+                new_rules.append(new_rule)
         return new_rules
 
-    def rule_constructive_dilemma(self) -> List[Expr]:
+    def _dilemma_candidates(self, delta, new_first_keys):
+        # 새 OR 사실, 또는 새 규칙이 어떤 선언지의 "첫 함의"가 된 경우의 OR 사실
+        candidates = delta & self._by_tag["OR"]
+        for key in new_first_keys:
+            candidates |= self._ors_by_disjunct.get(key, set())
+        return candidates
+
+    def rule_constructive_dilemma(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: implement constructive dilemma ===
         # (P OR R), P->Q, R->S => (Q OR S)
-        derived = []
-        for fact in self.facts:
-            if is_or(fact):
-                _, p, r = fact
-
-                q = None
-                for rule in self.rules:
-                    if is_implies(rule) and rule[1] == p:
-                        q = rule[2]
-                        break
-
-                s = None
-                for rule in self.rules:
-                    if is_implies(rule) and rule[1] == r:
-                        s = rule[2]
-                        break
-
-                if q and s:
-                    new_or = ("OR", q, s)
-                    if new_or not in self.facts:
-                        derived.append(new_or)
-        return derived
-
-    def rule_destructive_dilemma(self) -> List[Expr]:
+        delta, fresh_rules = self._pass_inputs(delta, fresh_rules)
+        facts = self.facts
+        first_consequent = self._first_consequent
+        candidates = self._dilemma_candidates(
+            delta, [p for _, p, q in fresh_rules if first_consequent[p] == q]
+        )
+        for _, p, r in candidates:
+            # 규칙 목록에서 가장 먼저 나온 함의를 고른다
+            q = first_consequent.get(p)
+            s = first_consequent.get(r)
+
+            if q and s:
+                new_or = self._shared(("OR", q, s))
+                if new_or not in facts:
+                    yield new_or
+
+    def rule_destructive_dilemma(self, delta=None, fresh_rules=None) -> Iterator[Expr]:
         # === QUIZ: implement destructive dilemma ===
         # (not Q OR not S), P->Q, R->S => (not P OR not R)
-        derived = []
-        for fact in self.facts:
-            if is_or(fact):
-                _, nq, ns = fact
-
-                p = None
-                for rule in self.rules:
-                    if is_implies(rule) and negate(rule[2]) == nq:
-                        p = rule[1]
-                        break
-
-                r = None
-                for rule in self.rules:
-                    if is_implies(rule) and negate(rule[2]) == ns:
-                        r = rule[1]
-                        break
-
-                if p and r:
-                    new_val = ("OR", negate(p), negate(r))
-                    if new_val not in self.facts:
-                        derived.append(new_val)
-        return derived
+        delta, fresh_rules = self._pass_inputs(delta, fresh_rules)
+        facts = self.facts
+        first_negated_antecedent = self._first_negated_antecedent
+        new_first_keys = []
+        for rule in fresh_rules:
+            not_q, not_p = self._rule_negations[id(rule)]
+            if first_negated_antecedent[not_q] == not_p:
+                new_first_keys.append(not_q)
+        candidates = self._dilemma_candidates(delta, new_first_keys)
+        for _, nq, ns in candidates:
+            not_p = first_negated_antecedent.get(nq)
+            not_r = first_negated_antecedent.get(ns)
+
+            if not_p and not_r:
+                new_val = self._shared(("OR", not_p, not_r))
+                if new_val not in facts:
+                    yield new_val
 
     def forward_chain(self, max_steps=1000, verbose=False):
         # === QUIZ: orchestrate repeated inference applications ===
+        # semi-naive: 각 패스는 직전 패스에 추가된 사실/규칙이 전제에 하나라도 낀 추론만 본다
+        self._sync_rules()
         for _ in range(max_steps):
-            new_facts = set()
-            new_rules = []
+            delta, self._delta = self._delta, set()
+            fresh_rules, self._fresh_rules = self._fresh_rules, []
+            if not delta and not fresh_rules:
+                break
 
             # 1. Facts
-            new_facts.update(self.rule_modus_ponens())
-            new_facts.update(self.rule_modus_tollens())
-            new_facts.update(self.rule_simplification())
-            new_facts.update(self.rule_conjunction())
-            new_facts.update(self.rule_disjunctive_addition())
-            new_facts.update(self.rule_disjunctive_syllogism())
-            new_facts.update(self.rule_constructive_dilemma())
-            new_facts.update(self.rule_destructive_dilemma())
+            # 규칙 메서드는 제너레이터이므로 결과를 모으지 않고 바로 넣는다.
+            # 패스 도중 들어간 사실은 다음 패스의 델타가 되므로 빠지는 추론은 없다.
+            for f in chain(
+                self.rule_modus_ponens(delta, fresh_rules),
+                self.rule_modus_tollens(delta, fresh_rules),
+                self.rule_simplification(delta, fresh_rules),
+                self.rule_conjunction(delta, fresh_rules),
+                self.rule_disjunctive_addition(delta, fresh_rules),
+                self.rule_disjunctive_syllogism(delta, fresh_rules),
+                self.rule_constructive_dilemma(delta, fresh_rules),
+                self.rule_destructive_dilemma(delta, fresh_rules),
+            ):
+                self._insert_fact(f)
 
             # 2. Rules
-            generated_rules = self.rule_hypothetical_syllogism()
-            for r in generated_rules:
-                if r not in self.rules:
-                    new_rules.append(r)
-
-            # 3. Update
-            changed = False
-            for f in new_facts:
-                if self.add_fact(f): changed = True
-
-            for r in new_rules:
-                if r not in self.rules:
-                    self.rules.append(r)
-                    changed = True
-
-            if not changed:
-                break
+            for r in self.rule_hypothetical_syllogism(delta, fresh_rules):
+                self._insert_rule(r)
 
         return self.facts
\ No newline at end of file
@@ -14,3 +14,38 @@ def test_all():
     kb.forward_chain()
     assert ("IMPLIES", "P", "U") in kb.rules and ("IMPLIES", "Q", "V") in kb.rules
     assert "R" in kb.facts and "U" in kb.facts
+
+
+def test_forward_chain_resumes_from_later_facts():
+    kb = KB(facts={("OR", "P", "Q")}, rules=[("IMPLIES", "Q", "R")])
+    kb.forward_chain()
+    assert "R" not in kb.facts
+
+    kb.add_fact(("NOT", "P"))
+    kb.forward_chain()
+    assert "Q" in kb.facts and "R" in kb.facts
+
+
+def test_negated_compound_disjunct_from_later_facts():
+    kb = KB(facts={("OR", ("AND", "A", "B"), "C")}, rules=[("IMPLIES", ("AND", "A", "B"), "Q")])
+    kb.forward_chain()
+    assert "C" not in kb.facts
+
+    kb.add_fact(("NOT", "Q"))
+    kb.forward_chain()
+    assert ("NOT", ("AND", "A", "B")) in kb.facts and "C" in kb.facts
+
+
+def test_rules_appended_directly_are_used():
+    kb = KB(facts={"P"}, rules=[("IMPLIES", "P", "Q")])
+    kb.forward_chain()
+    kb.rules.append(("IMPLIES", "Q", "R"))
+    kb.forward_chain()
+    assert "R" in kb.facts and ("IMPLIES", "P", "R") in kb.rules
+
+
+def test_rule_methods_allow_adding_their_results():
+    kb = KB(facts={"P", "Q"}, rules=[("IMPLIES", ("AND", "P", "Q"), "R")])
+    for fact in kb.rule_conjunction():
+        kb.add_fact(fact)
+    assert ("AND", "P", "Q") in kb.facts
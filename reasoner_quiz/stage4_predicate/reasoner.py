@@ -1,8 +1,12 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass
+import sys
+import warnings
+from dataclasses import dataclass, field
 from typing import (
+    Callable,
     Dict,
+    FrozenSet,
     Iterable,
     Iterator,
     List,
@@ -16,18 +20,107 @@ from typing import (
 Term = object
 Predicate = Tuple[str, ...]
 Substitution = Dict[str, Term]
+# 공유 치환을 제자리에서 고칠 때 되돌릴 기록: (변수, 이전 값 또는 _UNBOUND)
+Trail = List[Tuple[str, Term]]
+
+_MATCH_CACHE_SIZE = 100_000
+# semi-naive 패스는 한 번에 한 단계씩만 유도하므로 패스 수는 가장 긴 유도 사슬의 길이와 같다.
+# 스콜렘 상수나 함수 항이 끝없이 생기는 규칙을 멈추기 위한 상한이며, 여기에 닿으면 경고한다.
+# 함수 항은 패스마다 한 겹씩 깊어지므로 has_var 같은 재귀 함수가 재귀 한도에 닿기 전에 멈추도록 작게 둔다
+_MAX_PASSES = 200
+_EMPTY: FrozenSet[Predicate] = frozenset()
+_UNBOUND = object()
 
 
 def is_variable(term: Term) -> bool:
     return isinstance(term, str) and term.startswith("?")
 
 
-def substitute(expr: Term, subs: Substitution) -> Term:
+def walk(term: Term, subs: Substitution, trail: Optional[Trail] = None) -> Term:
+    # 변수 사슬(?x -> ?y -> a)을 반복문으로 끝까지 따라가고,
+    # 지나온 변수들이 최종 값을 바로 가리키도록 경로를 압축한다.
+    if not isinstance(term, str) or term not in subs:
+        return term
+
+    visited = []
+    while isinstance(term, str) and term in subs:
+        if term in visited:
+            raise ValueError(f"Cyclic substitution: {' -> '.join(visited + [term])}")
+        visited.append(term)
+        term = subs[term]
+
+    for var in visited[:-1]:
+        if trail is not None:
+            trail.append((var, subs[var]))
+        subs[var] = term
+    return term
+
+
+def undo(subs: Substitution, trail: Trail, mark: int) -> None:
+    # trail에서 mark 이후에 기록된 변경을 역순으로 되돌린다
+    while len(trail) > mark:
+        var, old = trail.pop()
+        if old is _UNBOUND:
+            del subs[var]
+        else:
+            subs[var] = old
+
+
+def substitute(expr: Term, subs: Substitution, trail: Optional[Trail] = None) -> Term:
+    if not subs:
+        return expr
+    root = None
     if isinstance(expr, str):
-        return subs.get(expr, expr)
-    if isinstance(expr, tuple):
-        return tuple(substitute(part, subs) for part in expr)
-    return expr
+        if expr not in subs:
+            return expr
+        root, expr = expr, walk(expr, subs, trail)
+    if not isinstance(expr, tuple):
+        return expr
+
+    # 흔한 경우: 중첩 없는 술어에 치환될 변수가 하나도 없으면 원래 튜플을 그대로 돌려준다
+    for part in expr:
+        if isinstance(part, tuple) or (isinstance(part, str) and part in subs):
+            break
+    else:
+        return expr
+
+    # 깊은 식에서도 재귀 한도에 걸리지 않도록 [튜플, 다음 인덱스, 새 부분 목록, 펼친 변수] 스택으로 훑는다.
+    # 바뀐 부분이 생길 때까지는 새 튜플을 만들지 않고, 끝까지 그대로면 원래 객체를 돌려준다.
+    # 지금 펼치고 있는 변수가 제 값 안에서 다시 나오면 치환이 순환하므로 끝없이 펼치지 않고 멈춘다.
+    stack: List[list] = [[expr, 0, None, root]]
+    expanding = {root}
+    while True:
+        frame = stack[-1]
+        node, i, parts, _ = frame
+        if i < len(node):
+            part = node[i]
+            if isinstance(part, str) and part in subs:
+                value = walk(part, subs, trail)
+                if isinstance(value, tuple):
+                    if part in expanding:
+                        raise ValueError(f"Cyclic substitution: {part} occurs in its own value")
+                    expanding.add(part)
+                    stack.append([value, 0, None, part])
+                    continue
+            elif isinstance(part, tuple):
+                stack.append([part, 0, None, None])
+                continue
+            else:
+                value = part
+        else:
+            expanding.discard(stack.pop()[3])
+            value = node if parts is None else tuple(parts)
+            if not stack:
+                return value
+            frame = stack[-1]
+            node, i, parts, _ = frame
+
+        # value는 node[i]를 치환한 결과
+        if parts is None and value is not node[i]:
+            parts = frame[2] = list(node[:i])
+        if parts is not None:
+            parts.append(value)
+        frame[1] = i + 1
 
 
 def occurs_check(var: str, value: Term, subs: Substitution) -> bool:
@@ -40,48 +133,90 @@ def occurs_check(var: str, value: Term, subs: Substitution) -> bool:
     return False
 
 
-def unify(x: Term, y: Term, subs: Optional[Substitution] = None) -> Optional[Substitution]:
+def unify(
+    x: Term, y: Term, subs: Optional[Substitution] = None, trail: Optional[Trail] = None
+) -> Optional[Substitution]:
     # === QUIZ: implement recursive unification ===
+    if x is y:
+        return {} if subs is None else subs
+
+    # trail이 주어지면 subs를 복사하지 않고 제자리에서 고치며, 실패 시 되돌리는 것은 호출한 쪽의 몫이다
     if subs is None:
         subs = {}
 
-    term_a = substitute(x, subs)
-    term_b = substitute(y, subs)
+    term_a = substitute(x, subs, trail)
+    term_b = substitute(y, subs, trail)
 
     if term_a == term_b:
         return subs
 
-    if is_variable(term_a):
-        return unify_var(term_a, term_b, subs)
+    # (타입, 타입) 표에서 분기를 한 번에 고른다; 표에 없는 조합은 일반 규칙을 따른다
+    return _UNIFY_DISPATCH.get((type(term_a), type(term_b)), _unify_mixed)(term_a, term_b, subs, trail)
+
+
+def _unify_str_str(a: str, b: str, subs: Substitution, trail: Optional[Trail]) -> Optional[Substitution]:
+    if a.startswith("?"):
+        return unify_var(a, b, subs, trail)
+    if b.startswith("?"):
+        return unify_var(b, a, subs, trail)
+    return None
 
-    if is_variable(term_b):
-        return unify_var(term_b, term_a, subs)
 
-    if isinstance(term_a, tuple) and isinstance(term_b, tuple):
-        if len(term_a) != len(term_b):
+def _unify_str_tuple(a: str, b: tuple, subs: Substitution, trail: Optional[Trail]) -> Optional[Substitution]:
+    return unify_var(a, b, subs, trail) if a.startswith("?") else None
+
+
+def _unify_tuple_str(a: tuple, b: str, subs: Substitution, trail: Optional[Trail]) -> Optional[Substitution]:
+    return unify_var(b, a, subs, trail) if b.startswith("?") else None
+
+
+def _unify_tuple_tuple(a: tuple, b: tuple, subs: Substitution, trail: Optional[Trail]) -> Optional[Substitution]:
+    if len(a) != len(b):
+        return None
+
+    current_bindings = subs
+    for part_a, part_b in zip(a, b):
+        current_bindings = unify(part_a, part_b, current_bindings, trail)
+        if current_bindings is None:
             return None
+    return current_bindings
 
-        current_bindings = subs
-        for part_a, part_b in zip(term_a, term_b):
-            current_bindings = unify(part_a, part_b, current_bindings)
-            if current_bindings is None:
-                return None
-        return current_bindings
 
+def _unify_mixed(a: Term, b: Term, subs: Substitution, trail: Optional[Trail]) -> Optional[Substitution]:
+    if is_variable(a):
+        return unify_var(a, b, subs, trail)
+    if is_variable(b):
+        return unify_var(b, a, subs, trail)
     return None
 
 
-def unify_var(var: str, value: Term, subs: Substitution) -> Optional[Substitution]:
+_UNIFY_DISPATCH: Dict[Tuple[type, type], Callable[..., Optional[Substitution]]] = {
+    (str, str): _unify_str_str,
+    (str, tuple): _unify_str_tuple,
+    (tuple, str): _unify_tuple_str,
+    (tuple, tuple): _unify_tuple_tuple,
+}
+
+
+def unify_var(
+    var: str, value: Term, subs: Substitution, trail: Optional[Trail] = None
+) -> Optional[Substitution]:
     # === QUIZ: handle variable binding during unification ===
     if var in subs:
-        return unify(subs[var], value, subs)
+        return unify(subs[var], value, subs, trail)
 
     if isinstance(value, str) and is_variable(value) and value in subs:
-        return unify(var, subs[value], subs)
+        return unify(var, subs[value], subs, trail)
 
-    if occurs_check(var, value, subs):
+    # 변수가 없는 값(ground 사실의 인자 등)에는 var가 나타날 수 없으므로 occurs check를 건너뛴다
+    if has_var(value) and occurs_check(var, value, subs):
         return None
 
+    if trail is not None:
+        trail.append((var, _UNBOUND))
+        subs[var] = value
+        return subs
+
     updated_subs = subs.copy()
     updated_subs[var] = value
     return updated_subs
@@ -91,6 +226,32 @@ def is_ground(fact: Predicate) -> bool:
     return all(not (isinstance(arg, str) and is_variable(arg)) for arg in fact)
 
 
+def has_var(term: Term) -> bool:
+    if isinstance(term, str):
+        return is_variable(term)
+    if isinstance(term, tuple):
+        return any(has_var(part) for part in term)
+    return False
+
+
+def freeze_term(term: Term) -> Term:
+    # 리스트를 튜플로 바꿔 해시할 수 있는 동등 비교 키를 만든다
+    if isinstance(term, (tuple, list)):
+        return tuple(freeze_term(part) for part in term)
+    return term
+
+
+def term_vars(term: Term) -> FrozenSet[str]:
+    if isinstance(term, str):
+        return frozenset((term,)) if is_variable(term) else _EMPTY
+    if isinstance(term, (tuple, list)):
+        found: Set[str] = set()
+        for part in term:
+            found |= term_vars(part)
+        return frozenset(found)
+    return _EMPTY
+
+
 def is_exists(expr: Term) -> bool:
     return isinstance(expr, tuple) and len(expr) == 3 and expr[0] == "EXISTS"
 
@@ -100,6 +261,200 @@ class Rule:
     variables: Tuple[str, ...]
     premises: Tuple[Predicate, ...]
     conclusion: Term
+    _compiled: Optional[Callable[..., Iterator]] = field(
+        default=None, repr=False, compare=False
+    )
+    # 컴파일된 매처가 바인딩 대신 결론 사실을 바로 만들어 낼 수 있는 규칙인지 여부
+    _datalog: bool = field(default=False, repr=False, compare=False)
+    # 전제별 변수 집합; 현재 치환과 겹치지 않는 전제는 substitute 없이 그대로 쓴다
+    _premise_vars: Tuple[FrozenSet[str], ...] = field(default=(), repr=False, compare=False)
+    # 컴파일된 매처가 실제로 조인하는 전제 순서 (pivot 번호도 이 순서를 따른다)
+    _plan: Tuple[Predicate, ...] = field(default=(), repr=False, compare=False)
+    # 전제들의 (술어 이름, 인자 수); 머리를 알 수 없는 전제가 있으면 None
+    _premise_heads: Optional[FrozenSet[Tuple[str, int]]] = field(default=None, repr=False, compare=False)
+
+
+def is_datalog_conclusion(conclusion: Term, premises: Sequence[Predicate]) -> bool:
+    # EXISTS가 없고, "술어(상수 | 전제에 나온 변수, ...)" 형태인 결론
+    if not isinstance(conclusion, tuple) or not conclusion or is_exists(conclusion):
+        return False
+    if has_var(conclusion[0]):
+        return False
+    premise_vars = {arg for premise in premises for arg in premise if is_variable(arg)}
+    for arg in conclusion[1:]:
+        if is_variable(arg):
+            if arg not in premise_vars:
+                return False
+        elif has_var(arg):
+            return False
+    return True
+
+
+def compile_premises(
+    premises: Sequence[Predicate], conclusion: Term = None
+) -> Optional[Callable[..., Iterator]]:
+    # 전제가 "술어(상수 | 변수, ...)" 형태일 때만 unify 없이 색인을 직접 훑는 매처를 만든다.
+    # 각 전제마다 상수 위치, 앞선 전제에서 묶인 변수(조인) 위치, 새로 묶을 변수 위치를 미리 계산한다.
+    # 변수는 등장 순서대로 정수 번호(slot)를 받고, 실행 중 바인딩은 dict 대신 slot별 지역 변수에 담는다.
+    # 결론 사실을 만들지 않을 때는 변수 이름 순서(solve.variables)의 값 튜플을 내놓는다.
+    steps = []
+    slots: Dict[str, int] = {}
+    bound_before: List[int] = []
+    for premise in premises:
+        if not isinstance(premise, tuple) or not premise or has_var(premise[0]):
+            return None
+
+        consts, joins, binds, repeats = [], [], [], []
+        local: Dict[str, int] = {}
+        for pos in range(1, len(premise)):
+            arg = premise[pos]
+            if is_variable(arg):
+                if arg in slots:
+                    joins.append((pos, slots[arg]))
+                elif arg in local:
+                    repeats.append((pos, local[arg]))
+                else:
+                    local[arg] = pos
+                    binds.append((pos, len(slots) + len(binds)))
+            elif has_var(arg):
+                return None
+            else:
+                consts.append((pos, arg))
+
+        # 새로 묶을 변수가 없는 전제는 사실 하나로 완전히 결정되므로 집합 소속만 확인하면 된다
+        probe = None
+        if not binds:
+            probe = [(True, slots[arg]) if is_variable(arg) else (False, arg) for arg in premise[1:]]
+
+        bound_before.append(len(slots))
+        for var in local:
+            slots[var] = len(slots)
+        steps.append((premise[0], len(premise), consts, joins, binds, repeats, probe))
+
+    slot_items = list(slots.items())
+
+    # idx번째 단계부터 끝까지의 성패는 그 앞에서 묶인 slot 중 이후 조인/소속 확인에 쓰이는 것에만 달려 있다
+    needed: List[Tuple[int, ...]] = []
+    for idx in range(len(steps)):
+        used = set()
+        for _, _, _, joins, _, _, probe in steps[idx:]:
+            used.update(slot for _, slot in joins)
+            if probe is not None:
+                used.update(arg for is_slot, arg in probe if is_slot)
+        needed.append(tuple(sorted(slot for slot in used if slot < bound_before[idx])))
+
+    # datalog 형태의 결론이면 slot에서 바로 결론 사실을 조립할 수 있다
+    head = None
+    if conclusion is not None and is_datalog_conclusion(conclusion, premises):
+        head = [(True, slots[arg]) if is_variable(arg) else (False, arg) for arg in conclusion[1:]]
+
+    return _generate_solver(steps, needed, slot_items, conclusion, head)
+
+
+def _generate_solver(
+    steps: Sequence[Tuple],
+    needed: Sequence[Tuple[int, ...]],
+    slot_items: Sequence[Tuple[str, int]],
+    conclusion: Term,
+    head: Optional[List[Tuple[bool, Term]]],
+) -> Callable[..., Iterator]:
+    # 규칙 모양에 맞춘 중첩 for 문을 소스로 만들어 exec한다.
+    # slot은 지역 변수 s0, s1, ...이 되고, 상수와 술어 이름은 이름공간으로 넘겨 repr에 의존하지 않는다.
+    namespace: Dict[str, object] = {"_EMPTY": _EMPTY}
+    lines = [
+        "def solve(kb, delta=None, pivot=None, conclude=False):",
+        "    facts = kb.facts",
+        "    by_head = kb._by_head",
+        "    by_arg = kb._by_arg",
+        # 한 번 호출하는 동안 사실 집합은 바뀌지 않으므로, 실패한 (단계, 필요한 slot 값)은 다시 풀지 않는다
+        "    failed = set()",
+    ]
+
+    def const(value: Term) -> str:
+        name = f"c{len(namespace)}"
+        namespace[name] = value
+        return name
+
+    def args_of(items: Sequence[Tuple[bool, Term]]) -> str:
+        return "".join(f", s{arg}" if is_slot else f", {const(arg)}" for is_slot, arg in items)
+
+    indent = "    "
+    tracked = []
+    for idx, (name, arity, consts, joins, binds, repeats, probe) in enumerate(steps):
+        name_ref = const(name)
+        if probe is not None:
+            lines.append(f"{indent}fact = ({name_ref}{args_of(probe)},)")
+            lines.append(
+                f"{indent}if fact in facts and not (pivot == {idx} and fact not in delta)"
+                f" and not (pivot is not None and pivot > {idx} and fact in delta):"
+            )
+            indent += "    "
+            continue
+
+        if idx:
+            key = "".join(f", s{slot}" for slot in needed[idx])
+            lines.append(f"{indent}key{idx} = ({idx}{key},)")
+            lines.append(f"{indent}if key{idx} not in failed:")
+            indent += "    "
+            lines.append(f"{indent}found{idx} = False")
+
+        lines.append(f"{indent}bucket = by_head.get(({name_ref}, {arity}), _EMPTY)")
+        for pos, value in consts:
+            lines.append(f"{indent}narrowed = by_arg.get(({name_ref}, {arity}, {pos}, {const(value)}), _EMPTY)")
+            lines.append(f"{indent}if len(narrowed) < len(bucket): bucket = narrowed")
+        for pos, slot in joins:
+            lines.append(f"{indent}narrowed = by_arg.get(({name_ref}, {arity}, {pos}, s{slot}), _EMPTY)")
+            lines.append(f"{indent}if len(narrowed) < len(bucket): bucket = narrowed")
+        lines += [
+            f"{indent}if pivot == {idx}:",
+            f"{indent}    if len(delta) < len(bucket):",
+            f"{indent}        cands{idx} = [f for f in delta if f in bucket]",
+            f"{indent}    else:",
+            f"{indent}        cands{idx} = [f for f in bucket if f in delta]",
+            f"{indent}elif pivot is not None and pivot > {idx}:",
+            f"{indent}    cands{idx} = [f for f in bucket if f not in delta]",
+            f"{indent}else:",
+            f"{indent}    cands{idx} = bucket",
+            f"{indent}for f{idx} in cands{idx}:",
+        ]
+        if idx:
+            # 이 단계에서 결과가 하나도 없으면 for 문이 끝난 뒤 실패 표에 기록한다 (맨 끝에서 덧붙임)
+            tracked.append((indent, idx))
+        indent += "    "
+        # 버킷이 (이름, 인자 수)로 나뉘어 있으므로 길이는 다시 확인하지 않는다
+        checks = [f"f{idx}[{pos}] != {const(value)}" for pos, value in consts]
+        checks += [f"f{idx}[{pos}] != s{slot}" for pos, slot in joins]
+        checks += [f"f{idx}[{pos}] != f{idx}[{first}]" for pos, first in repeats]
+        if checks:
+            lines.append(f"{indent}if {' or '.join(checks)}:")
+            lines.append(f"{indent}    continue")
+        for pos, slot in binds:
+            lines.append(f"{indent}s{slot} = f{idx}[{pos}]")
+
+    if tracked:
+        lines.append(f"{indent}{' = '.join(f'found{idx}' for _, idx in tracked)} = True")
+    lines.append(f"{indent}if conclude:")
+    if head is not None:
+        # 이미 아는 사실은 내보내지 않는다; 호출 중 사실 집합은 그대로이므로 found 표시는 위에서 먼저 해 둔다
+        lines.append(f"{indent}    derived = ({const(conclusion[0])}{args_of(head)},)")
+        lines.append(f"{indent}    if derived not in facts:")
+        lines.append(f"{indent}        yield derived")
+    else:
+        lines.append(f"{indent}    raise ValueError('conclusion is not datalog-shaped')")
+    lines.append(f"{indent}else:")
+    # 변수 이름 순서로 내놓아, 전제 순서가 바뀌어 다시 컴파일되어도 같은 바인딩은 같은 튜플이 된다
+    ordered = sorted(slot_items)
+    lines.append(f"{indent}    yield ({''.join(f's{slot}, ' for _, slot in ordered)})")
+
+    # 실패 기록은 각 단계의 for 문 바로 뒤(같은 들여쓰기)에 들어가야 하므로, 안쪽 단계부터 끼워 넣는다
+    for loop_indent, idx in reversed(tracked):
+        lines.append(f"{loop_indent}if not found{idx}:")
+        lines.append(f"{loop_indent}    failed.add(key{idx})")
+
+    exec("\n".join(lines), namespace)
+    solve = namespace["solve"]
+    solve.variables = tuple(var for var, _ in ordered)
+    return solve
 
 
 class KB:
@@ -111,6 +466,29 @@ class KB:
         self.facts: Set[Predicate] = set()
         self.rules: List[Rule] = []
         self._exist_counter = 0
+        # 직전 forward_chain 패스 이후 새로 추가된 사실 (semi-naive 평가용)
+        self._delta: Set[Predicate] = set()
+        # 아직 전체 사실에 대해 한 번도 평가되지 않은 규칙
+        self._fresh_rules: List[Rule] = []
+        # 이미 결론을 만든 (규칙 id, 바인딩) 조합
+        self._fired: Set[Tuple[int, FrozenSet]] = set()
+        # (술어 이름, 인자 수)별 / (술어 이름, 인자 수, 인자 위치, 상수 값)별 사실 색인
+        self._by_head: Dict[Tuple[str, int], Set[Predicate]] = {}
+        self._by_arg: Dict[Tuple[str, int, int, Term], Set[Predicate]] = {}
+        # 색인으로 걸러낼 수 없는 사실(변수 인자, 비정형 사실)이 있으면 색인 사용을 제한
+        self._open_preds: Set[Tuple[str, int]] = set()
+        self._unindexed = 0
+        # 색인에 반영된 사실 수; self.facts와 어긋나면 kb.facts를 직접 고친 것이므로 다시 색인한다
+        self._indexed_count = 0
+        # 목표 패턴 -> (사실, 확장 치환) 목록; 사실이 추가되면 비운다
+        self._match_cache: Dict[Predicate, List[Tuple[Predicate, Optional[Substitution]]]] = {}
+        # (전제들, 남은 전제 번호, pivot) -> 다음에 풀 전제 번호; 색인 크기가 바뀌는 패스마다 비운다
+        self._plan_cache: Dict[Tuple, int] = {}
+        # 이미 추가된 규칙의 (변수, 전제, 결론); 같은 규칙을 두 번 넣어도 한 번만 평가한다
+        self._rule_keys: Set[Tuple] = set()
+        # 해시 콘싱 풀: 같은 사실/전제는 한 객체를 공유해 동등 비교가 동일성 검사로 끝난다.
+        # KB마다 따로 두어 KB가 사라지면 풀도 함께 사라진다
+        self._pool: Dict[Term, Term] = {}
 
         # 뼈대에는 없지만 초기화 로직이 필요하여 추가 (테스트 통과 필수)
         if facts:
@@ -120,65 +498,497 @@ class KB:
             for r in rules:
                 self.add_rule(r)
 
+    def _intern(self, term: Term) -> Term:
+        # 문자열(술어 이름, 상수, 변수)은 sys.intern으로, 튜플은 하위 항까지 풀에 넣는다
+        if isinstance(term, str):
+            return sys.intern(term)
+        if isinstance(term, tuple):
+            term = tuple(self._intern(part) for part in term)
+            try:
+                return self._pool.setdefault(term, term)
+            except TypeError:
+                # ("EXISTS", [변수...], 본문)처럼 리스트가 든 식은 해시할 수 없으므로 풀에 넣지 않는다
+                return term
+        if isinstance(term, list):
+            return [self._intern(part) for part in term]
+        return term
+
     def add_fact(self, fact: Predicate) -> bool:
         if fact in self.facts:
             return False
+        fact = self._intern(fact)
         self.facts.add(fact)
+        self._delta.add(fact)
+        self._index_fact(fact)
+        self._indexed_count += 1
+        self._match_cache.clear()
         return True
 
+    def bulk_add_facts(self, facts: Iterable[Predicate], validated: bool = False) -> int:
+        # validated=True는 모든 사실이 "상수 이름(원자 인자, ...)" 형태의 평평한 튜플임을 호출한 쪽이 보장한다는 뜻이다.
+        # 그때는 사실마다 모양/중첩 검사를 하지 않고, 새 사실을 집합 차로 골라 색인을 한 번에 갱신한다.
+        if not validated:
+            return sum(self.add_fact(fact) for fact in facts)
+
+        new = [self._intern(fact) for fact in set(facts) - self.facts]
+        if not new:
+            return 0
+        self.facts.update(new)
+        self._delta.update(new)
+        by_head, by_arg = self._by_head, self._by_arg
+        for fact in new:
+            name, arity = fact[0], len(fact)
+            by_head.setdefault((name, arity), set()).add(fact)
+            for pos in range(1, arity):
+                arg = fact[pos]
+                if isinstance(arg, str) and arg.startswith("?"):
+                    self._open_preds.add((name, arity))
+                    continue
+                by_arg.setdefault((name, arity, pos, arg), set()).add(fact)
+        self._indexed_count += len(new)
+        self._match_cache.clear()
+        return len(new)
+
+    def _sync_facts(self) -> None:
+        # add_fact를 거치지 않고 kb.facts를 직접 고쳤다면 색인을 처음부터 다시 만들고,
+        # 색인에 없던 사실은 다음 패스의 delta로 넘긴다
+        if len(self.facts) == self._indexed_count:
+            return
+        by_head = self._by_head
+        for fact in self.facts:
+            if (
+                not isinstance(fact, tuple)
+                or not fact
+                or has_var(fact[0])
+                or fact not in by_head.get((fact[0], len(fact)), _EMPTY)
+            ):
+                self._delta.add(fact)
+        self._by_head, self._by_arg = {}, {}
+        self._open_preds = set()
+        self._unindexed = 0
+        for fact in self.facts:
+            self._index_fact(fact)
+        self._indexed_count = len(self.facts)
+        self._match_cache.clear()
+
     def add_rule(self, rule: Term) -> None:
         parsed = rule if isinstance(rule, Rule) else self._parse_rule(rule)
+        parsed.variables = tuple(self._intern(var) for var in parsed.variables)
+        parsed.premises = tuple(self._intern(premise) for premise in parsed.premises)
+        parsed.conclusion = self._intern(parsed.conclusion)
+        key = freeze_term((parsed.variables, parsed.premises, parsed.conclusion))
+        if key in self._rule_keys:
+            return
+        self._rule_keys.add(key)
+        parsed._premise_vars = tuple(term_vars(premise) for premise in parsed.premises)
+        parsed._plan = parsed.premises
+        parsed._premise_heads = self._heads_of(parsed.premises)
+        parsed._compiled = compile_premises(parsed.premises, parsed.conclusion)
+        parsed._datalog = parsed._compiled is not None and is_datalog_conclusion(
+            parsed.conclusion, parsed.premises
+        )
         self.rules.append(parsed)
+        self._fresh_rules.append(parsed)
 
-    def forward_chain(self, max_iterations: int = 50) -> None:
+    def forward_chain(self, max_iterations: int = _MAX_PASSES) -> None:
         # === QUIZ: repeatedly apply rules and grow the fact set ===
+        # 새 사실(delta)이 더 나오지 않을 때까지 패스를 반복한다
+        self._sync_facts()
         for _ in range(max_iterations):
-            fact_added = False
+            # 이번 패스에서는 직전 패스 이후 추가된 사실(delta)이 포함된 조합만 평가
+            delta, self._delta = self._delta, set()
+            self._plan_cache.clear()
+            fresh_ids = {id(rule) for rule in self._fresh_rules}
+            self._fresh_rules = []
+            # delta에 사실이 하나도 없는 (술어 이름, 인자 수)의 전제는 pivot이 될 수 없다
+            delta_heads = self._heads_of(delta)
+
+            # 패스 도중에는 self.facts와 색인을 건드리지 않고, 추론된 사실을 모았다가 패스가 끝나면 합친다
+            pending: Set[Predicate] = set()
             for rule in self.rules:
-                for bindings in self._satisfying_substitutions(rule.premises):
+                # 전제의 어느 술어에도 새 사실이 없으면 이 규칙은 이번 패스에서 만들 것이 없다
+                if (
+                    id(rule) not in fresh_ids
+                    and delta_heads is not None
+                    and rule._premise_heads is not None
+                    and rule._premise_heads.isdisjoint(delta_heads)
+                ):
+                    continue
+                if self._compiled_ready(rule):
+                    self._replan(rule)
+                if rule._datalog and self._compiled_ready(rule):
+                    # datalog 규칙은 바인딩을 거치지 않고 결론 사실을 집합 연산으로 한꺼번에 모은다
+                    pending.update(
+                        self._datalog_conclusions(rule, delta, id(rule) in fresh_ids, delta_heads)
+                    )
+                    continue
+
+                if id(rule) in fresh_ids:
+                    matches = self._rule_substitutions(rule)
+                else:
+                    matches = self._satisfying_substitutions_incremental(rule, delta, delta_heads)
+
+                # 컴파일된 매처는 값 튜플을 내놓으므로, 새로 발화하는 경우에만 치환 dict를 만든다
+                compiled = self._compiled_ready(rule)
+                for row in matches:
+                    # 같은 규칙이 같은 바인딩으로 이미 발화했다면 결론을 다시 만들 필요가 없다
+                    firing = (id(rule), row if compiled else frozenset(row.items()))
+                    if firing in self._fired:
+                        continue
+                    self._fired.add(firing)
+                    bindings = dict(zip(rule._compiled.variables, row)) if compiled else row
+
                     conclusion_term = rule.conclusion
 
                     if is_exists(conclusion_term):
                         # 이미 스콜렘 상수로 치환된 결과가 존재하는지 확인 (무한 생성 방지)
                         check_pattern = substitute(conclusion_term[2], bindings)
-                        if self.query(check_pattern):
+                        if self._holds(check_pattern) or any(
+                            unify(check_pattern, fact) is not None for fact in pending
+                        ):
                             continue
 
                         inferred_fact = self._instantiate_exists(substitute(conclusion_term, bindings))
                     else:
                         inferred_fact = substitute(conclusion_term, bindings)
 
-                    if self.add_fact(inferred_fact):
-                        fact_added = True
+                    pending.add(inferred_fact)
+
+            fact_added = False
+            for inferred_fact in pending - self.facts:
+                if self.add_fact(inferred_fact):
+                    fact_added = True
 
             if not fact_added:
                 break
+        else:
+            warnings.warn(
+                f"forward_chain stopped after {max_iterations} passes; the facts may not be a fixpoint",
+                RuntimeWarning,
+                stacklevel=2,
+            )
 
     def query(self, pattern: Predicate) -> List[Substitution]:
         # === QUIZ: perform pattern matching against known facts ===
-        matched_results = []
-        for known_fact in self.facts:
+        return [match_subs for _, match_subs in self.match(pattern)]
+
+    def match(self, pattern: Term) -> List[Tuple[Predicate, Substitution]]:
+        # 패턴과 단일화되는 사실과 그 치환을 색인으로 좁힌 후보에서만 찾는다
+        self._sync_facts()
+        return list(self._iter_match(pattern))
+
+    def _iter_match(self, pattern: Term) -> Iterator[Tuple[Predicate, Substitution]]:
+        if not has_var(pattern) and not self._unindexed and not self._open_preds:
+            # 변수 없는 패턴은 모든 사실이 ground일 때 집합 소속 확인 한 번으로 끝난다
+            if pattern in self.facts:
+                yield pattern, {}
+            return
+
+        for known_fact in self._narrowed(pattern):
             match_subs = unify(pattern, known_fact)
             if match_subs is not None:
-                matched_results.append(match_subs)
-        return matched_results
+                yield known_fact, match_subs
+
+    def _holds(self, pattern: Term) -> bool:
+        # query()와 달리 끝까지 모으지 않고, 하나라도 맞으면 바로 멈춘다
+        return next(self._iter_match(pattern), None) is not None
+
+    def _narrowed(self, goal: Term) -> Set[Predicate]:
+        # 상수 인자가 여럿이면 작은 버킷부터 교집합을 내어 후보를 더 줄인다
+        if (
+            self._unindexed
+            or not isinstance(goal, tuple)
+            or not goal
+            or has_var(goal[0])
+            or (goal[0], len(goal)) in self._open_preds
+        ):
+            return self._candidates(goal)
+
+        name, arity = goal[0], len(goal)
+        buckets = [
+            self._by_arg.get((name, arity, pos, goal[pos]), _EMPTY)
+            for pos in range(1, arity)
+            if not has_var(goal[pos])
+        ]
+        if not buckets:
+            return self._by_head.get((name, arity), _EMPTY)
+
+        buckets.sort(key=len)
+        narrowed = buckets[0]
+        for bucket in buckets[1:]:
+            if not narrowed:
+                break
+            narrowed = narrowed & bucket
+        return narrowed
+
+    def _index_fact(self, fact: Predicate) -> None:
+        if not isinstance(fact, tuple) or not fact or has_var(fact[0]):
+            self._unindexed += 1
+            return
+
+        name, arity = fact[0], len(fact)
+        self._by_head.setdefault((name, arity), set()).add(fact)
+        for pos in range(1, arity):
+            arg = fact[pos]
+            if has_var(arg):
+                self._open_preds.add((name, arity))
+                continue
+            self._by_arg.setdefault((name, arity, pos, arg), set()).add(fact)
+
+    def _candidates(self, goal: Term) -> Set[Predicate]:
+        # 목표와 단일화될 수 있는 사실만 담은 가장 작은 색인 버킷을 고른다
+        if self._unindexed or not isinstance(goal, tuple) or not goal or has_var(goal[0]):
+            return self.facts
+
+        name, arity = goal[0], len(goal)
+        best = self._by_head.get((name, arity), set())
+        if (name, arity) in self._open_preds:
+            return best
+
+        for pos in range(1, arity):
+            arg = goal[pos]
+            if has_var(arg):
+                continue
+            bucket = self._by_arg.get((name, arity, pos, arg), set())
+            if len(bucket) < len(best):
+                best = bucket
+        return best
 
-    def _satisfying_substitutions(self, premises: Sequence[Predicate]) -> Iterator[Substitution]:
+    def _matches(self, goal: Predicate) -> List[Tuple[Predicate, Optional[Substitution]]]:
+        # 같은 목표에 대한 단일화 결과는 사실 집합이 바뀌기 전까지 재사용한다.
+        # 변수가 있는 사실은 호출 시점의 치환에 따라 결과가 달라지므로 None으로 남긴다.
+        cached = self._match_cache.get(goal)
+        if cached is not None:
+            return cached
+
+        # 상수 인자가 여럿이면 가장 작은 버킷 하나 대신 버킷들의 교집합만 단일화한다
+        cached = []
+        for fact in self._narrowed(goal):
+            if has_var(fact):
+                cached.append((fact, None))
+                continue
+            extension = unify(goal, fact, {})
+            if extension is not None:
+                cached.append((fact, extension))
+
+        if len(self._match_cache) >= _MATCH_CACHE_SIZE:
+            self._match_cache.clear()
+        self._match_cache[goal] = cached
+        return cached
+
+    def _satisfying_substitutions(
+        self,
+        premises: Sequence[Predicate],
+        delta: Optional[Set[Predicate]] = None,
+        pivot: Optional[int] = None,
+        premise_vars: Optional[Sequence[FrozenSet[str]]] = None,
+    ) -> Iterator[Substitution]:
         # === QUIZ: backtracking search for substitutions that satisfy premises ===
-        def dfs_search(idx: int, current_subs: Substitution) -> Iterator[Substitution]:
-            if idx == len(premises):
-                yield current_subs
+        # pivot이 주어지면 pivot번째 전제는 delta에서만, 그 앞의 전제는 delta 밖의 사실에서만 고른다.
+        # 전제는 원래 순서 대신 매번 후보가 가장 적은 것부터 푼다 (_next_premise 참고).
+        # 치환은 하나의 dict를 제자리에서 고치고, 깊이마다 trail 위치를 기억했다가 되돌아갈 때 되돌린다.
+        # 탐색 중 바뀌지 않는 상태는 클로저 대신 search 튜플 하나로 _backtrack에 넘긴다.
+        search = (premises, delta, pivot, premise_vars, {}, [])
+        return self._backtrack(search, tuple(range(len(premises))))
+
+    def _backtrack(self, search: Tuple, remaining: Tuple[int, ...]) -> Iterator[Substitution]:
+        current_subs, trail = search[4], search[5]
+        if not remaining:
+            yield dict(current_subs)
+            return
+
+        mark = len(trail)
+        try:
+            yield from self._expand_premise(search, remaining)
+        finally:
+            undo(current_subs, trail, mark)
+
+    def _expand_premise(self, search: Tuple, remaining: Tuple[int, ...]) -> Iterator[Substitution]:
+        premises, delta, pivot, premise_vars, current_subs, trail = search
+        idx = self._next_premise(premises, remaining, current_subs, delta, pivot, trail)
+        rest = tuple(i for i in remaining if i != idx)
+        if premise_vars is not None and current_subs.keys().isdisjoint(premise_vars[idx]):
+            target_premise = premises[idx]
+        else:
+            target_premise = substitute(premises[idx], current_subs, trail)
+        # 여기까지의 경로 압축은 이 깊이의 모든 후보가 공유하므로 후보마다 되돌리지 않는다
+        mark = len(trail)
+
+        if not has_var(target_premise) and not self._unindexed and not self._open_preds:
+            # 변수가 남지 않은 목표는 단일화 대신 집합 소속만 확인한다
+            if target_premise not in self.facts:
                 return
+            if pivot is not None:
+                if idx == pivot and target_premise not in delta:
+                    return
+                if idx < pivot and target_premise in delta:
+                    return
+            yield from self._backtrack(search, rest)
+            return
+
+        if pivot is not None and idx == pivot and len(delta) < len(self._candidates(target_premise)):
+            # delta가 색인 버킷보다 작으면 delta를 직접 훑는다
+            matches = [(fact, None) for fact in delta]
+        else:
+            matches = self._matches(target_premise)
+
+        # 후보마다 반복되는 조건과 전역/속성 조회를 루프 밖에서 한 번만 한다
+        backtrack = self._backtrack
+        only_delta = pivot is not None and idx == pivot
+        skip_delta = pivot is not None and idx < pivot
+        disjoint = current_subs.keys().isdisjoint
+        record = trail.append
+        unify_, undo_ = unify, undo
+        for fact, extension in matches:
+            if only_delta and fact not in delta:
+                continue
+            if skip_delta and fact in delta:
+                continue
+
+            if extension is not None and disjoint(extension):
+                for var, value in extension.items():
+                    record((var, _UNBOUND))
+                    current_subs[var] = value
+            elif unify_(target_premise, fact, current_subs, trail) is None:
+                undo_(current_subs, trail, mark)
+                continue
+            yield from backtrack(search, rest)
+            undo_(current_subs, trail, mark)
+
+    def _estimate_cardinality(self, goal: Term, delta: Optional[Set[Predicate]] = None) -> int:
+        size = len(self._candidates(goal))
+        return min(size, len(delta)) if delta is not None else size
+
+    def _next_premise(
+        self,
+        premises: Sequence[Predicate],
+        remaining: Tuple[int, ...],
+        subs: Substitution,
+        delta: Optional[Set[Predicate]],
+        pivot: Optional[int],
+        trail: Optional[Trail] = None,
+    ) -> int:
+        # 변수가 든 사실은 단일화 순서에 따라 결과 변수 이름이 달라지므로 원래 순서를 지킨다
+        if len(remaining) == 1 or self._unindexed or self._open_preds:
+            return remaining[0]
+
+        # 남은 전제 집합이 같으면 묶인 변수도 같으므로, 패스마다 한 번만 순서를 정한다
+        key = (tuple(premises), remaining, pivot)
+        idx = self._plan_cache.get(key)
+        if idx is None:
+            idx = min(
+                remaining,
+                key=lambda i: self._estimate_cardinality(
+                    substitute(premises[i], subs, trail), delta if i == pivot else None
+                ),
+            )
+            self._plan_cache[key] = idx
+        return idx
+
+    def _rule_substitutions(
+        self,
+        rule: Rule,
+        delta: Optional[Set[Predicate]] = None,
+        pivot: Optional[int] = None,
+    ) -> Iterator:
+        # 컴파일된 매처는 rule._compiled.variables 순서의 값 튜플을, 그 밖에는 치환 dict를 내놓는다
+        if self._compiled_ready(rule):
+            return rule._compiled(self, delta, pivot)
+        if len(rule._premise_vars) != len(rule.premises):
+            # add_rule을 거치지 않고 kb.rules에 바로 넣은 규칙은 여기서 처음 계산한다
+            rule._premise_vars = tuple(term_vars(premise) for premise in rule.premises)
+        return self._satisfying_substitutions(rule.premises, delta, pivot, rule._premise_vars)
+
+    def _datalog_conclusions(
+        self,
+        rule: Rule,
+        delta: Set[Predicate],
+        fresh: bool,
+        delta_heads: Optional[FrozenSet[Tuple[str, int]]] = None,
+    ) -> Iterator[Predicate]:
+        if fresh:
+            yield from rule._compiled(self, conclude=True)
+            return
+        for pivot in self._delta_pivots(rule, delta, delta_heads):
+            yield from rule._compiled(self, delta, pivot, True)
+
+    def _replan(self, rule: Rule) -> None:
+        # 현재 색인 크기로 조인 순서를 다시 정하고, 순서가 바뀐 경우에만 매처를 다시 만든다
+        plan = tuple(rule.premises[i] for i in self._join_order(rule.premises))
+        if plan != rule._plan:
+            rule._plan = plan
+            rule._compiled = compile_premises(plan, rule.conclusion)
 
-            target_premise = substitute(premises[idx], current_subs)
+    def _join_order(self, premises: Sequence[Predicate]) -> List[int]:
+        # 후보가 가장 적은 전제부터 고르되, 이미 고른 전제와 변수를 공유하는 전제를 먼저 붙여 곱집합을 피한다
+        sizes = []
+        for premise in premises:
+            name, arity = premise[0], len(premise)
+            size = len(self._by_head.get((name, arity), _EMPTY))
+            for pos in range(1, arity):
+                if not is_variable(premise[pos]):
+                    size = min(size, len(self._by_arg.get((name, arity, pos, premise[pos]), _EMPTY)))
+            sizes.append(size)
 
-            # 런타임 중 집합 변경 방지를 위해 리스트로 복사 후 순회
-            for fact in list(self.facts):
-                next_subs = unify(target_premise, fact, current_subs.copy())
-                if next_subs is not None:
-                    yield from dfs_search(idx + 1, next_subs)
+        order: List[int] = []
+        bound: Set[str] = set()
+        remaining = list(range(len(premises)))
+        while remaining:
+            idx = min(
+                remaining,
+                key=lambda i: (bool(order) and bound.isdisjoint(premises[i][1:]), sizes[i], i),
+            )
+            remaining.remove(idx)
+            order.append(idx)
+            bound.update(arg for arg in premises[idx][1:] if is_variable(arg))
+        return order
 
-        return dfs_search(0, {})
+    def _compiled_ready(self, rule: Rule) -> bool:
+        # 컴파일된 매처는 모든 사실이 색인되어 있을 때만 쓸 수 있다
+        return rule._compiled is not None and not self._unindexed and not self._open_preds
+
+    def _satisfying_substitutions_incremental(
+        self,
+        rule: Rule,
+        delta: Set[Predicate],
+        delta_heads: Optional[FrozenSet[Tuple[str, int]]] = None,
+    ) -> Iterator:
+        # semi-naive: 적어도 하나의 전제가 delta의 사실과 매칭되는 조합만 열거
+        # 서로 다른 pivot에서 같은 바인딩이 나오면 forward_chain의 _fired 검사에서 걸러진다
+        for pivot in self._delta_pivots(rule, delta, delta_heads):
+            yield from self._rule_substitutions(rule, delta, pivot)
+
+    def _delta_pivots(
+        self,
+        rule: Rule,
+        delta: Set[Predicate],
+        delta_heads: Optional[FrozenSet[Tuple[str, int]]],
+    ) -> List[int]:
+        # pivot 전제의 (이름, 인자 수)에 해당하는 delta 사실이 없으면 앞선 전제를 훑어 봐야 결과가 없다
+        if not delta:
+            return []
+        if delta_heads is None:
+            delta_heads = self._heads_of(delta)
+        if delta_heads is None:
+            return list(range(len(rule.premises)))
+        return [
+            pivot
+            for pivot, premise in enumerate(rule._plan if self._compiled_ready(rule) else rule.premises)
+            if not isinstance(premise, tuple)
+            or not premise
+            or has_var(premise[0])
+            or (premise[0], len(premise)) in delta_heads
+        ]
+
+    @staticmethod
+    def _heads_of(facts: Iterable[Predicate]) -> Optional[FrozenSet[Tuple[str, int]]]:
+        # 머리를 알 수 없는 사실이 섞여 있으면 None을 돌려 모든 전제를 pivot 후보로 남긴다
+        heads: Set[Tuple[str, int]] = set()
+        for fact in facts:
+            if not isinstance(fact, tuple) or not fact or has_var(fact[0]):
+                return None
+            heads.add((fact[0], len(fact)))
+        return frozenset(heads)
 
     def _instantiate_exists(self, expr: Term) -> Predicate:
         # === QUIZ: skolemize existential quantifiers ===
@@ -221,4 +1031,4 @@ class KB:
             return (raw[1], raw[2])
         return (raw,)
 
-__all__ = ["KB", "Rule", "unify", "substitute", "is_variable"]
+__all__ = ["KB", "Rule", "unify", "substitute", "is_variable", "freeze_term"]
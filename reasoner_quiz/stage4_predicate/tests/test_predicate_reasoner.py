@@ -1,4 +1,6 @@
-from reasoner import KB, unify
+import pytest
+
+from reasoner import KB, Rule, substitute, unify
 
 
 def test_transitive_ancestor():
@@ -74,3 +76,171 @@ def test_unify_handles_nested_structures():
     right = ("likes", "mia", ("pair", "mia", "cello"))
     result = unify(left, right, {})
     assert result == {"?x": "mia", "?y": "cello"}
+
+
+def test_forward_chain_picks_up_facts_added_later():
+    kb = KB(
+        facts=[("parent", "alice", "bob")],
+        rules=[
+            (
+                "FORALL",
+                ["?x", "?y", "?z"],
+                (
+                    "IMPLIES",
+                    [("parent", "?x", "?y"), ("parent", "?y", "?z")],
+                    ("grandparent", "?x", "?z"),
+                ),
+            )
+        ],
+    )
+    kb.forward_chain()
+    assert not kb.query(("grandparent", "?x", "?z"))
+
+    kb.add_fact(("parent", "bob", "carol"))
+    kb.forward_chain()
+    assert ("grandparent", "alice", "carol") in kb.facts
+
+
+def test_rules_with_constants_and_repeated_variables():
+    kb = KB(
+        facts=[
+            ("likes", "mia", "mia"),
+            ("likes", "mia", "cello"),
+            ("likes", "bob", "cello"),
+        ],
+        rules=[
+            (
+                "FORALL",
+                ["?x"],
+                ("IMPLIES", [("likes", "?x", "?x")], ("narcissist", "?x")),
+            ),
+            (
+                "FORALL",
+                ["?x"],
+                ("IMPLIES", [("likes", "?x", "cello")], ("musician", "?x")),
+            ),
+        ],
+    )
+    kb.forward_chain()
+    assert kb.query(("narcissist", "?who")) == [{"?who": "mia"}]
+    assert {ans["?who"] for ans in kb.query(("musician", "?who"))} == {"mia", "bob"}
+
+
+def test_existential_rule_fires_once_per_witness_pattern():
+    kb = KB(
+        facts=[("parent", "mia", "ann"), ("parent", "mia", "ben")],
+        rules=[
+            (
+                "FORALL",
+                ["?x", "?c"],
+                (
+                    "IMPLIES",
+                    [("parent", "?x", "?c")],
+                    ("EXISTS", ["?y"], ("loves", "?x", "?y")),
+                ),
+            )
+        ],
+    )
+    kb.forward_chain()
+    assert len([fact for fact in kb.facts if fact[0] == "loves"]) == 1
+
+
+def test_ground_query_checks_membership():
+    kb = KB(facts=[("parent", "alice", "bob")])
+    assert kb.query(("parent", "alice", "bob")) == [{}]
+    assert kb.query(("parent", "bob", "alice")) == []
+
+    kb.add_fact(("parent", "?x", "carol"))
+    assert kb.query(("parent", "dana", "carol")) == [{"?x": "dana"}]
+
+
+def test_bulk_add_facts_indexes_new_facts_once():
+    kb = KB(facts=[("parent", "alice", "bob")])
+    added = kb.bulk_add_facts(
+        [("parent", "alice", "bob"), ("parent", "bob", "carol"), ("parent", "?x", "dana")],
+        validated=True,
+    )
+    assert added == 2
+    assert {"?who": "carol"} in kb.query(("parent", "bob", "?who"))
+    assert kb.query(("parent", "erin", "dana")) == [{"?x": "erin"}]
+
+
+def test_duplicate_rules_are_added_once():
+    rule = ("FORALL", ["?x"], ("IMPLIES", [("parent", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y"))))
+    kb = KB(facts=[("parent", "mia")], rules=[rule, rule])
+    assert len(kb.rules) == 1
+
+
+def test_zero_arity_premises_and_conclusions():
+    kb = KB(
+        facts=[("rain",), ("person", "bob")],
+        rules=[
+            ("FORALL", [], ("IMPLIES", [("rain",)], ("wet",))),
+            ("FORALL", ["?x"], ("IMPLIES", [("person", "?x"), ("rain",)], ("soaked", "?x"))),
+        ],
+    )
+    kb.forward_chain()
+    assert ("wet",) in kb.facts
+    assert ("soaked", "bob") in kb.facts
+
+
+def test_forward_chain_reaches_fixpoint_on_long_chains():
+    people = [f"p{i}" for i in range(71)]
+    kb = KB(
+        facts=[("parent", a, b) for a, b in zip(people, people[1:])],
+        rules=[
+            ("FORALL", ["?x", "?y"], ("IMPLIES", [("parent", "?x", "?y")], ("ancestor", "?x", "?y"))),
+            (
+                "FORALL",
+                ["?x", "?y", "?z"],
+                ("IMPLIES", [("parent", "?x", "?y"), ("ancestor", "?y", "?z")], ("ancestor", "?x", "?z")),
+            ),
+        ],
+    )
+    kb.forward_chain()
+    assert len(kb.query(("ancestor", "?x", "?y"))) == 70 * 71 // 2
+    assert ("ancestor", "p0", "p70") in kb.facts
+
+
+def test_rules_appended_directly_are_used():
+    kb = KB(facts=[("parent", "a", "b"), ("parent", "b", "c")])
+    kb.rules.append(
+        Rule(
+            variables=("?x", "?y", "?z"),
+            premises=(("parent", "?x", "?y"), ("parent", "?y", "?z")),
+            conclusion=("grandparent", "?x", "?z"),
+        )
+    )
+    kb.forward_chain()
+    assert ("grandparent", "a", "c") in kb.facts
+
+
+def test_facts_added_to_the_fact_set_directly_are_seen():
+    kb = KB(
+        facts=[("parent", "a", "b")],
+        rules=[("FORALL", ["?x", "?y"], ("IMPLIES", [("parent", "?x", "?y")], ("ancestor", "?x", "?y")))],
+    )
+    kb.forward_chain()
+    kb.facts.add(("parent", "b", "c"))
+    assert kb.query(("parent", "b", "?y")) == [{"?y": "c"}]
+
+    kb.forward_chain()
+    assert ("ancestor", "b", "c") in kb.facts
+
+
+def test_substitute_rejects_cyclic_substitutions():
+    with pytest.raises(ValueError):
+        substitute(("p", "?x"), {"?x": ("f", "?x")})
+    with pytest.raises(ValueError):
+        substitute(("p", "?x"), {"?x": "?y", "?y": "?x"})
+    assert substitute(("p", "?x", "?x"), {"?x": ("f", "?y"), "?y": "a"}) == ("p", ("f", "a"), ("f", "a"))
+
+
+def test_forward_chain_warns_when_the_pass_cap_is_hit():
+    kb = KB(
+        facts=[("num", "zero")],
+        rules=[("FORALL", ["?x"], ("IMPLIES", [("num", "?x")], ("num", ("succ", "?x"))))],
+    )
+    with pytest.warns(RuntimeWarning):
+        kb.forward_chain(max_iterations=10)
+    assert len(kb.facts) == 11
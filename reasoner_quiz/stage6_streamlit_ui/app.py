@@ -1,16 +1,18 @@
 ﻿from __future__ import annotations
 
+import hashlib
+import heapq
 import re
 import sys
 from pathlib import Path
-from typing import List, Sequence, Tuple
+from typing import Dict, List, MutableMapping, Sequence, Tuple
 
 import streamlit as st
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT / "stage4_predicate"))
 
-from reasoner import KB  # type: ignore
+from reasoner import KB, freeze_term  # type: ignore
 
 Fact = Tuple[str, ...]
 Rule = Tuple
@@ -25,6 +27,15 @@ forall x,y: ancestor(x,y) -> connected(x,y)"""
 
 DEFAULT_QUERY = "ancestor(?who, dana)"
 
+# 결과 화면에 보여줄 사실 수 상한 (정렬 순 앞쪽부터)
+FACT_DISPLAY_LIMIT = 500
+
+# 줄마다 다시 컴파일하지 않도록 모듈 로드 시 한 번만 컴파일
+# 인자 부분은 닫는 괄호 전까지만 읽어 긴 줄에서 되돌아가며 찾지 않게 한다
+# 술어는 fullmatch로 한 번에 검사해, 닫는 괄호 뒤에 남은 글자가 있으면 오류로 본다
+_PRED_RE = re.compile(r"(\w+)\s*\(([^)]*)\)")
+_FORALL_RE = re.compile(r"forall\s+([^:]+):\s*(.*)", re.IGNORECASE)
+
 
 class ParseError(Exception):
     """Raised when the text-based KB format cannot be parsed."""
@@ -39,27 +50,28 @@ def parse_predicate(token: str, variables: Sequence[str]) -> Fact:
     # === QUIZ: parse predicate tokens, normalizing variables and constants ===
     raw_token = token.strip()
     # "name(arg1, arg2)" 형태 매칭
-    regex_match = re.match(r"(\w+)\s*\((.*)\)", raw_token)
+    regex_match = _PRED_RE.fullmatch(raw_token)
     if not regex_match:
         raise ParseError(f"잘못된 술어 형식입니다: {raw_token}")
 
-    pred_name = regex_match.group(1)
-    args_str = regex_match.group(2)
+    pred_name, args_str = regex_match.groups()
+    # 같은 이름/상수는 한 문자열 객체를 공유해 KB의 집합/딕셔너리 비교가 동일성 검사로 끝나게 한다
+    pred_name = sys.intern(pred_name)
 
-    # 쉼표로 인자 분리 및 공백 제거
-    raw_args = [arg.strip() for arg in args_str.split(",") if arg.strip()]
+    # 쉼표로 인자 분리 및 공백 제거 (인자마다 strip은 한 번만)
+    raw_args = [arg for raw in args_str.split(",") if (arg := raw.strip())]
 
     normalized_args = []
     for arg in raw_args:
         # 1. 이미 '?'로 시작하면 변수 그대로 사용
         if arg.startswith("?"):
-            normalized_args.append(arg)
+            normalized_args.append(sys.intern(arg))
         # 2. 규칙의 forall 변수 목록에 포함된 경우 '?' 붙여서 변수화
         elif arg in variables:
-            normalized_args.append(f"?{arg}")
+            normalized_args.append(sys.intern(f"?{arg}"))
         # 3. 그 외에는 상수(Constant)로 처리
         else:
-            normalized_args.append(arg)
+            normalized_args.append(sys.intern(arg))
 
     return (pred_name, *normalized_args)
 
@@ -69,7 +81,7 @@ def parse_rule(line: str) -> Rule:
     clean_line = line.strip()
 
     # "forall x,y: ..." 파싱
-    header_match = re.match(r"forall\s+([^:]+):\s*(.*)", clean_line, re.IGNORECASE)
+    header_match = _FORALL_RE.match(clean_line)
     if not header_match:
         raise ParseError(f"규칙은 'forall'로 시작해야 합니다: {clean_line}")
 
@@ -97,21 +109,101 @@ def parse_rule(line: str) -> Rule:
     return ("FORALL", internal_vars, (premises_list, conclusion_pred))
 
 
+def rule_lines(text: str) -> List[str]:
+    # 빈 줄을 빼고, 글자 그대로 같은 규칙 줄은 한 번만 남긴다 (순서는 유지)
+    return list(dict.fromkeys(line.strip() for line in text.splitlines() if line.strip()))
+
+
+# 블록/질의 파서는 원문 텍스트를 키로 캐시되어, 입력이 그대로인 rerun에서는 다시 파싱하지 않는다
+@st.cache_data(show_spinner=False)
 def parse_facts_block(text: str) -> List[Fact]:
     # === QUIZ: split multi-line facts and parse each line ===
     return [parse_fact(l) for l in text.splitlines() if l.strip()]
 
 
+@st.cache_data(show_spinner=False)
 def parse_rules_block(text: str) -> List[Rule]:
     # === QUIZ: parse a block of rule lines ===
-    return [parse_rule(l) for l in text.splitlines() if l.strip()]
+    return [parse_rule(l) for l in rule_lines(text)]
+
 
+def intern_symbols(value):
+    # 캐시에서 역직렬화된 값의 문자열을 다시 intern해 같은 이름/상수가 한 객체를 가리키게 한다
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, tuple):
+        return tuple(intern_symbols(part) for part in value)
+    if isinstance(value, list):
+        return [intern_symbols(part) for part in value]
+    return value
 
+
+@st.cache_data(show_spinner=False)
+def parse_kb_blocks(facts_text: str, rules_text: str) -> Tuple[List[Fact], List[Rule]]:
+    # 사실과 규칙을 한 캐시 항목으로 묶어, 캐시에서 꺼낼 때도 같은 이름/상수가
+    # 사실과 규칙 사이에서 한 객체로 공유되도록 한다 (pickle은 한 항목 안의 공유만 보존)
+    # 캐시된 블록 파서는 각자 따로 역직렬화된 복사본을 돌려주므로 문자열을 다시 intern해 묶는다
+    facts = intern_symbols(parse_facts_block(facts_text))
+    rules = intern_symbols(parse_rules_block(rules_text))
+    return facts, rules
+
+
+@st.cache_data(show_spinner=False)
 def parse_query(text: str) -> Fact:
     # === QUIZ: parse a query string into predicate form ===
     return parse_predicate(text, [])
 
 
+def text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def sync_kb(state: MutableMapping, facts: List[Fact], rules: List[Rule]) -> KB:
+    # 세션에 KB를 유지하고, 직전 입력에서 늘어난 사실/규칙만 넣어 추론을 이어간다.
+    # 지워진 줄이 있으면 이미 유도된 사실을 되돌릴 수 없으므로 처음부터 다시 만든다.
+    # 이전 입력과의 비교는 집합으로 한다; 규칙은 리스트가 들어 있어 freeze_term으로 해시 가능한 키를 만든다
+    fact_set = set(facts)
+    rule_keys = {freeze_term(rule): rule for rule in rules}
+    previous = state.get("kb_session")
+    if previous is not None:
+        kb, prev_facts, prev_rules = previous
+        removed = not prev_facts <= fact_set or not prev_rules <= rule_keys.keys()
+        if not removed:
+            added_facts = [f for f in facts if f not in prev_facts]
+            added_rules = [rule for key, rule in rule_keys.items() if key not in prev_rules]
+            if added_facts or added_rules:
+                kb.bulk_add_facts(added_facts, validated=True)
+                for rule in added_rules:
+                    kb.add_rule(rule)
+                kb.forward_chain()
+            state["kb_session"] = (kb, fact_set, set(rule_keys))
+            return kb
+
+    # parse_fact는 평평한 술어 튜플만 만들므로 사실은 검사 없이 한 번에 넣는다
+    kb = KB(rules=rules)
+    kb.bulk_add_facts(facts, validated=True)
+    kb.forward_chain()
+    state["kb_session"] = (kb, fact_set, set(rule_keys))
+    return kb
+
+
+@st.cache_data(show_spinner=False)
+def run_query(facts_hash: str, rules_hash: str, query_text: str, _kb: KB) -> List[Dict[str, object]]:
+    return _kb.query(parse_query(query_text))
+
+
+@st.cache_data(show_spinner=False)
+def fact_table(facts_hash: str, rules_hash: str, _kb: KB) -> Tuple[Dict[str, List[str]], int]:
+    # 전체를 정렬하지 않고 화면에 보일 앞쪽 일부만 뽑는다.
+    # 튜플 그대로 비교해 뽑은 뒤, 보여줄 행만 열(column)별 목록으로 만든다
+    shown_facts = heapq.nsmallest(FACT_DISPLAY_LIMIT, _kb.facts)
+    table = {
+        "predicate": [fact[0] for fact in shown_facts],
+        "arguments": [", ".join(fact[1:]) for fact in shown_facts],
+    }
+    return table, len(_kb.facts)
+
+
 def main() -> None:
     st.set_page_config(page_title="Logic Reasoner", layout="wide")
     st.title("Stage 6 — Streamlit KB UI")
@@ -124,6 +216,7 @@ def main() -> None:
             st.session_state["q_input"] = DEFAULT_QUERY
         if st.button("결과 초기화 (Clear Results)"):
             st.session_state.pop("last_facts", None)
+            st.session_state.pop("last_fact_total", None)
             st.session_state.pop("last_query_results", None)
 
     if "f_input" not in st.session_state:
@@ -177,17 +270,15 @@ def main() -> None:
             st.session_state["q_input"] = query_text
 
             try:
-                parsed_facts = parse_facts_block(facts_text)
-                parsed_rules = parse_rules_block(rules_text)
-                parsed_query = parse_query(query_text)
-
-                kb = KB(facts=parsed_facts, rules=parsed_rules)
-                kb.forward_chain()
+                facts_hash, rules_hash = text_digest(facts_text), text_digest(rules_text)
+                parsed_facts, parsed_rules = parse_kb_blocks(facts_text, rules_text)
+                kb = sync_kb(st.session_state, parsed_facts, parsed_rules)
 
-                display_facts = sorted([f"{f[0]}({', '.join(f[1:])})" for f in kb.facts])
-                query_results = kb.query(parsed_query)
+                display_facts, fact_total = fact_table(facts_hash, rules_hash, kb)
+                query_results = run_query(facts_hash, rules_hash, query_text, kb)
 
                 st.session_state["last_facts"] = display_facts
+                st.session_state["last_fact_total"] = fact_total
                 st.session_state["last_query_results"] = query_results
 
                 st.success("추론이 성공적으로 완료되었습니다!")
@@ -200,7 +291,13 @@ def main() -> None:
         # 최근 결과 표시(버튼 누른 뒤에도 유지)
         if "last_facts" in st.session_state:
             st.markdown("**지식 베이스 (KB Facts)**")
-            st.write(st.session_state["last_facts"])
+            shown = st.session_state["last_facts"]
+            shown_count = len(shown["predicate"])
+            total = st.session_state.get("last_fact_total", shown_count)
+            if total > shown_count:
+                st.caption(f"전체 {total}개 중 앞의 {shown_count}개만 표시합니다.")
+            # dataframe은 화면에 보이는 행만 그려서 긴 목록도 가볍게 표시된다
+            st.dataframe(shown, hide_index=True)
         else:
             st.info("아직 결과가 없습니다. 왼쪽에서 입력 후 실행하세요.")
 
@@ -3,11 +3,18 @@ import pytest
 from app import (
     DEFAULT_FACTS,
     DEFAULT_QUERY,
+    DEFAULT_RULES,
+    ParseError,
+    fact_table,
     parse_fact,
+    parse_kb_blocks,
     parse_facts_block,
     parse_query,
     parse_rule,
     parse_rules_block,
+    run_query,
+    sync_kb,
+    text_digest,
 )
 
 
@@ -37,3 +44,47 @@ def test_parse_invalid_fact_raises():
 def test_rules_block_ignores_blank_lines():
     rules = parse_rules_block("""forall x: parent(x) -> ancestor(x)\n\n""")
     assert len(rules) == 1
+
+
+def test_sync_kb_ingests_added_lines_into_session_kb():
+    state = {}
+    facts, rules = parse_facts_block(DEFAULT_FACTS), parse_rules_block(DEFAULT_RULES)
+    kb = sync_kb(state, facts, rules)
+    assert ("ancestor", "alice", "dana") in kb.facts
+
+    facts_hash, rules_hash = text_digest(DEFAULT_FACTS), text_digest(DEFAULT_RULES)
+    answers = run_query(facts_hash, rules_hash, DEFAULT_QUERY, kb)
+    assert {ans["?who"] for ans in answers} == {"alice", "bob", "carol"}
+
+    more = facts + [("parent", "dana", "erin")]
+    assert sync_kb(state, more, rules) is kb
+    assert ("ancestor", "alice", "erin") in kb.facts
+
+    rebuilt = sync_kb(state, facts, rules)
+    assert rebuilt is not kb
+    assert ("ancestor", "alice", "erin") not in rebuilt.facts
+
+
+def test_parse_kb_blocks_shares_names_between_facts_and_rules():
+    facts, rules = parse_kb_blocks(DEFAULT_FACTS, DEFAULT_RULES)
+    assert facts == parse_facts_block(DEFAULT_FACTS)
+    assert facts[0][0] is rules[0][2][0][0][0]
+
+
+def test_parse_fact_rejects_trailing_text():
+    with pytest.raises(ParseError):
+        parse_fact("parent(alice,bob) parent(bob,carol)")
+
+
+def test_fact_table_lists_facts_in_sorted_columns():
+    state = {}
+    kb = sync_kb(state, parse_facts_block(DEFAULT_FACTS), parse_rules_block(DEFAULT_RULES))
+    table, total = fact_table(text_digest(DEFAULT_FACTS), text_digest(DEFAULT_RULES), kb)
+    assert total == len(kb.facts)
+    assert table["predicate"][0] == "ancestor"
+    assert table["arguments"][0] == "alice, bob"
+
+
+def test_rules_block_collapses_repeated_lines():
+    line = "forall x: parent(x) -> ancestor(x)"
+    assert len(parse_rules_block(f"{line}\n  {line}\n")) == 1